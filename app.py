@@ -2,88 +2,175 @@ import dash
 from dash import dcc, html
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
-from scipy.stats import pearsonr
+import functools
+import hashlib
+import orjson
+import os
+import pickle
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Serialização das figuras (layout do Dash) com orjson
+pio.json.config.default_engine = 'orjson'
+
+# Cache em disco das respostas da API (IBGE atualiza no máximo mensalmente)
+CACHE_DIR = Path(__file__).resolve().parent / "ibge_cache"
+CACHE_TTL = 24 * 60 * 60  # 24h
+
+# Sessão HTTP persistente (keep-alive) para o host da API do IBGE
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=2))
 
 # ==========================================
 # 1. METODOLOGIA E COLETA DE DADOS (APIs IBGE)
 # ==========================================
+def read_json_cache(cache_file):
+    try:
+        data = orjson.loads(cache_file.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    return data if isinstance(data, list) and data else None
+
+def get_json_cached(url, timeout=15):
+    cache_file = CACHE_DIR / (hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+    if cache_file.exists() and time.time() - cache_file.stat().st_mtime < CACHE_TTL:
+        data = read_json_cache(cache_file)
+        if data is not None:
+            return data
+
+    try:
+        resp = session.get(url, timeout=timeout)
+        resp.raise_for_status()
+        data = orjson.loads(resp.content)
+        if not (isinstance(data, list) and data):
+            raise ValueError(f"Resposta inesperada da API do IBGE: {url}")
+    except (requests.RequestException, ValueError):  # orjson.JSONDecodeError é ValueError
+        # IBGE fora do ar ou resposta inválida: usa a cópia vencida em disco, se houver
+        data = read_json_cache(cache_file)
+        if data is None:
+            raise
+        return data
+
+    # Só chega aqui com resposta válida (lista de variáveis); erros nunca vão para o cache
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        cache_file.write_bytes(orjson.dumps(data))
+    except OSError:
+        pass  # Cache é opcional (ex.: disco somente leitura)
+    return data
+
+def flatten_series(resp):
+    # Achata o JSON do IBGE em colunas: período e valor bruto por registro, localidade
+    # uma vez por série (id, nome, nº de registros)
+    periodos, valores, ids, nomes, contagens = [], [], [], [], []
+    if resp:
+        for resultado in resp[0].get('resultados', []):
+            for serie_data in resultado.get('series', []):
+                serie = serie_data['serie']
+                periodos.extend(serie.keys())
+                valores.extend(serie.values())
+                ids.append(str(serie_data['localidade']['id']))
+                nomes.append(serie_data['localidade']['nome'])
+                contagens.append(len(serie))
+
+    # Marcadores do IBGE ('...', '-', 'X') viram NaN numa única passada em C e são descartados
+    valor = pd.to_numeric(np.array(valores, dtype=object), errors='coerce').astype(np.float32)  # float32: valores do IBGE têm no máximo 2 casas decimais
+    valid = ~np.isnan(valor)
+    # Localidade expandida por série com np.repeat (sem repetir strings por registro em Python)
+    return {'periodo': np.array(periodos, dtype=object)[valid],
+            'id': np.repeat(np.array(ids, dtype=object), contagens)[valid],
+            'nome': np.repeat(np.array(nomes, dtype=object), contagens)[valid],
+            'valor': valor[valid]}
+
 def fetch_ibge_data():
     url_ipca = "https://servicodados.ibge.gov.br/api/v3/agregados/7060/periodos/202001-202412/variaveis/63?localidades=N7[all]"
     url_pnad = "https://servicodados.ibge.gov.br/api/v3/agregados/4099/periodos/202001-202404/variaveis/4099?localidades=N2[all]"
     
     try:
-        resp_ipca = requests.get(url_ipca, timeout=15).json()
-        resp_pnad = requests.get(url_pnad, timeout=15).json()
+        # As duas consultas são independentes: executa em paralelo
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            fut_ipca = ex.submit(get_json_cached, url_ipca)
+            fut_pnad = ex.submit(get_json_cached, url_pnad)
+            resp_ipca = fut_ipca.result()
+            resp_pnad = fut_pnad.result()
     except Exception:
         return pd.DataFrame() 
 
+    # Dicionário fixo das 5 Grandes Regiões (usado como categorias)
+    macro_map = {'1': 'Norte', '2': 'Nordeste', '3': 'Sudeste', '4': 'Sul', '5': 'Centro-Oeste'}
+
     # Parse IPCA - CORRIGIDO O NÍVEL DO JSON
-    ipca_records = []
-    if resp_ipca:
-        for resultado in resp_ipca[0].get('resultados', []):
-            for serie_data in resultado.get('series', []):
-                rm_name = serie_data['localidade']['nome']
-                rm_id = str(serie_data['localidade']['id'])
-                macro_code = rm_id[0] # 1 a 5
-                for periodo, valor in serie_data['serie'].items():
-                    if valor not in ('...', '-', 'X'):
-                        try:
-                            ipca_records.append({'Mes': periodo, 'RM': rm_name, 'Macro_ID': macro_code, 'IPCA': float(valor)})
-                        except ValueError:
-                            pass
-    
-    df_ipca = pd.DataFrame(ipca_records)
+    ipca = flatten_series(resp_ipca)
+    df_ipca = pd.DataFrame({'Mes': ipca['periodo'], 'RM': ipca['nome'], 'Macro_ID': ipca['id'],
+                            'IPCA': ipca['valor']}, copy=False)
     if df_ipca.empty: return pd.DataFrame()
+    df_ipca['Macro_ID'] = pd.Categorical(df_ipca['Macro_ID'].str[0], categories=list(macro_map)) # 1 a 5
     
     # Transformar Mensal em Trimestral
-    df_ipca['Ano'] = df_ipca['Mes'].str[:4]
-    df_ipca['Trimestre'] = pd.to_datetime(df_ipca['Mes'], format='%Y%m').dt.quarter
-    df_ipca['Trimestre_Cod'] = df_ipca['Ano'] + "0" + df_ipca['Trimestre'].astype(str)
+    # Trimestre_Cod como inteiro AAAA0T (ex.: 202001), mesmo formato do período da PNAD
+    mes_i = df_ipca['Mes'].to_numpy().astype(np.int32)  # AAAAMM
+    df_ipca['Ano'] = mes_i // 100
+    df_ipca['Trimestre'] = ((mes_i % 100 - 1) // 3 + 1).astype(np.int8)
+    df_ipca['Trimestre_Cod'] = df_ipca['Ano'] * 100 + df_ipca['Trimestre']
     
-    df_ipca_trim = df_ipca.groupby(['Macro_ID', 'Trimestre_Cod'])['IPCA'].mean().reset_index()
+    df_ipca_trim = df_ipca.groupby(['Macro_ID', 'Trimestre_Cod'], observed=True)['IPCA'].mean().astype(np.float32).reset_index()
     df_ipca_trim['IPCA_Acum_Trim'] = df_ipca_trim['IPCA'] * 3 
 
     # Parse PNAD - CORRIGIDO O NÍVEL DO JSON
-    pnad_records = []
-    macro_map = {'1': 'Norte', '2': 'Nordeste', '3': 'Sudeste', '4': 'Sul', '5': 'Centro-Oeste'}
-    if resp_pnad:
-        for resultado in resp_pnad[0].get('resultados', []):
-            for serie_data in resultado.get('series', []):
-                macro_id = str(serie_data['localidade']['id'])
-                for periodo, valor in serie_data['serie'].items():
-                    if valor not in ('...', '-', 'X'):
-                        try:
-                            pnad_records.append({'Trimestre_Cod': periodo, 'Macro_ID': macro_id, 'Desemprego': float(valor)})
-                        except ValueError:
-                            pass
-    
-    df_pnad = pd.DataFrame(pnad_records)
+    pnad = flatten_series(resp_pnad)
+    df_pnad = pd.DataFrame({'Trimestre_Cod': pnad['periodo'].astype(np.int32), 'Macro_ID': pnad['id'],
+                            'Desemprego': pnad['valor']}, copy=False)
     if df_pnad.empty: return pd.DataFrame()
+    df_pnad['Macro_ID'] = pd.Categorical(df_pnad['Macro_ID'], categories=list(macro_map))
     
-    # Merge Final
-    df_final = pd.merge(df_pnad, df_ipca_trim, on=['Macro_ID', 'Trimestre_Cod'], how='inner')
+    # Merge Final - chaves já ordenadas dos dois lados (o groupby do IPCA já sai ordenado)
+    df_pnad = df_pnad.sort_values(['Macro_ID', 'Trimestre_Cod'], ignore_index=True)
+    df_final = pd.merge(df_pnad, df_ipca_trim, on=['Macro_ID', 'Trimestre_Cod'], how='inner',
+                        sort=False, validate='one_to_one')
     if df_final.empty: return pd.DataFrame()
 
-    df_final['Regiao'] = df_final['Macro_ID'].map(macro_map)
-    df_final['Data'] = pd.PeriodIndex(df_final['Trimestre_Cod'].str[:4] + "Q" + df_final['Trimestre_Cod'].str[-1], freq='Q').to_timestamp()
+    # Categorias em ordem alfabética: barras, pizza e mapa mantêm a ordem (e as cores) do groupby original
+    df_final['Regiao'] = pd.Categorical(df_final['Macro_ID'].map(macro_map),
+                                        categories=sorted(macro_map.values()))
+    # Data = 1º dia do trimestre, direto de AAAA0T sem passar por strings
+    ano = df_final['Trimestre_Cod'] // 100
+    tri = df_final['Trimestre_Cod'] % 10
+    df_final['Data'] = pd.to_datetime(pd.DataFrame({'year': ano, 'month': (tri - 1) * 3 + 1, 'day': 1}))
     
     return df_final
 
-df = fetch_ibge_data()
-
 # ==========================================
 # 2. CONSTRUÇÃO DO DASHBOARD (PLOTLY/DASH)
 # ==========================================
-app = dash.Dash(__name__)
-app.title = "Dashboard Econométrico: TCC"
+def pearson(x, y):
+    # Pearson r direto em NumPy (evita o import e as validações de scipy.stats)
+    xm = x - x.mean()
+    ym = y - y.mean()
+    r = float((xm @ ym) / np.sqrt((xm @ xm) * (ym @ ym)))
+    # p-valor bicaudal do teste t com n-2 g.l.: I_{1-r²}(gl/2, 1/2)
+    from scipy.special import betainc
+    gl = len(x) - 2
+    p_value = float(betainc(gl / 2, 0.5, max(0.0, 1 - r * r)))
+    return r, p_value
 
-if df.empty:
-    app.layout = html.Div("Erro ao carregar ou cruzar dados da API do IBGE.")
-else:
-    df_bar = df.groupby('Regiao')[['Desemprego', 'IPCA_Acum_Trim']].mean().reset_index()
+def build_figures(df):
+    # Médias por região via np.bincount sobre os códigos da categoria (sem hash do groupby)
+    codes = df['Regiao'].cat.codes.to_numpy()
+    valid = codes >= 0
+    codes = codes[valid]
+    regioes = df['Regiao'].cat.categories
+    counts = np.bincount(codes, minlength=len(regioes))
+    observed = counts > 0
+    df_bar = pd.DataFrame({'Regiao': pd.Categorical(regioes[observed], categories=regioes)})
+    for col in ('Desemprego', 'IPCA_Acum_Trim'):
+        sums = np.bincount(codes, weights=df[col].to_numpy()[valid], minlength=len(regioes))
+        df_bar[col] = (sums[observed] / counts[observed]).astype(np.float32)
     fig_bar = go.Figure(data=[
         go.Bar(name='Tx. Desemprego Média (%)', x=df_bar['Regiao'], y=df_bar['Desemprego'], marker_color='indianred'),
         go.Bar(name='IPCA Médio Trimestral (%)', x=df_bar['Regiao'], y=df_bar['IPCA_Acum_Trim'], marker_color='lightsalmon')
@@ -99,8 +186,9 @@ else:
     coords = {'Norte': [-3.11, -60.02], 'Nordeste': [-12.97, -38.51], 'Sudeste': [-23.55, -46.63], 
               'Sul': [-30.03, -51.23], 'Centro-Oeste': [-15.79, -47.88]}
     df_map = df_bar.copy()
-    df_map['lat'] = df_map['Regiao'].map(lambda x: coords[x][0])
-    df_map['lon'] = df_map['Regiao'].map(lambda x: coords[x][1])
+    latlon = np.array([coords[reg] for reg in df_map['Regiao']], dtype=np.float64)
+    df_map['lat'] = latlon[:, 0]
+    df_map['lon'] = latlon[:, 1]
     
     fig_map = px.scatter_mapbox(df_map, lat="lat", lon="lon", hover_name="Regiao", 
                                 hover_data=["Desemprego", "IPCA_Acum_Trim"],
@@ -109,13 +197,85 @@ else:
                                 title="Mapa Analítico: Intensidade do Desemprego e Inflação")
     fig_map.update_layout(mapbox_style="carto-positron")
 
-    fig_scatter = px.scatter(df, x="IPCA_Acum_Trim", y="Desemprego", color="Regiao", trendline="ols",
+    fig_scatter = px.scatter(df, x="IPCA_Acum_Trim", y="Desemprego", color="Regiao",
                              title="Relação Econométrica: Inflação vs Desemprego (Curva de Phillips Regional)",
                              labels={"IPCA_Acum_Trim": "Inflação (IPCA Trimestral %)", "Desemprego": "Taxa de Desocupação (%)"})
+    # Reta de MQO por região com np.polyfit (substitui trendline="ols", que ajusta via statsmodels)
+    ipca_trim = df['IPCA_Acum_Trim'].to_numpy()
+    desemprego = df['Desemprego'].to_numpy()
+    for trace in list(fig_scatter.data):
+        mask = (df['Regiao'] == trace.name).to_numpy()
+        if mask.sum() < 2:
+            continue
+        x = ipca_trim[mask].astype(np.float64)
+        y = desemprego[mask].astype(np.float64)
+        m, b = np.polyfit(x, y, 1)
+        r2 = np.corrcoef(x, y)[0, 1] ** 2
+        # Extremos pela representação decimal do float32 (evita -1.3199999332427979 no hover)
+        x_ends = np.array([ipca_trim[mask].min(), ipca_trim[mask].max()]).astype(str).astype(np.float64)
+        fig_scatter.add_scatter(x=x_ends, y=m * x_ends + b, mode='lines', name=trace.name,
+                                legendgroup=trace.legendgroup, line_color=trace.marker.color, showlegend=False,
+                                hovertemplate=(f"<b>Tendência MQO</b><br>Desemprego = {m:.4f} * IPCA_Acum_Trim + {b:.4f}"
+                                               f"<br>R<sup>2</sup>={r2:.4f}<br><br>Regiao={trace.name}"
+                                               "<br>Inflação (IPCA Trimestral %)=%{x:.2f}"
+                                               "<br>Taxa de Desocupação (%)=%{y:.2f} <b>(tendência)</b><extra></extra>"))
     
-    r, p_value = pearsonr(df['IPCA_Acum_Trim'], df['Desemprego'])
+    r, p_value = pearson(df['IPCA_Acum_Trim'].to_numpy(np.float64), df['Desemprego'].to_numpy(np.float64))
+
+    # Figuras como dicts prontos: o Dash serializa o layout a cada requisição e um
+    # go.Figure seria copiado (to_dict) de novo em toda chamada
+    figs = tuple(fig.to_dict() for fig in (fig_bar, fig_line, fig_pie, fig_map, fig_scatter))
+    return figs + (r, p_value)
+
+# Dados + figuras prontos em disco, compartilhados entre os workers do gunicorn.
+# Fica no diretório do projeto (não no /tmp compartilhado) e o nome inclui um hash do
+# código: qualquer alteração em app.py invalida o pickle antigo
+CODE_VERSION = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()[:12]
+DASH_CACHE = CACHE_DIR / f"dashboard_{CODE_VERSION}.pkl"
+
+def read_dashboard_cache():
+    try:
+        with DASH_CACHE.open('rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None  # Ausente, corrompido ou de outra versão do pandas/plotly: reconstrói
+
+def load_dashboard():
+    if DASH_CACHE.exists() and time.time() - DASH_CACHE.stat().st_mtime < CACHE_TTL:
+        dashboard = read_dashboard_cache()
+        if dashboard is not None:
+            return dashboard
 
-    app.layout = html.Div(style={'fontFamily': 'Arial', 'padding': '20px', 'maxWidth': '1200px', 'margin': 'auto'}, children=[
+    df = fetch_ibge_data()
+    if df.empty:
+        # Falha na coleta: serve o último dashboard em disco, mesmo vencido
+        return read_dashboard_cache()
+    dashboard = (df,) + build_figures(df)
+    try:
+        # Grava em arquivo temporário e renomeia: outro worker nunca lê um pickle pela metade
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp_file = DASH_CACHE.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_file.open('wb') as f:
+            pickle.dump(dashboard, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, DASH_CACHE)
+        # Remove pickles de versões anteriores do código (senão ibge_cache/ cresce a cada deploy)
+        for old_cache in CACHE_DIR.glob("dashboard_*.pkl"):
+            if old_cache != DASH_CACHE:
+                old_cache.unlink(missing_ok=True)
+    except OSError:
+        pass
+    return dashboard
+
+# Layout montado sob demanda (1ª requisição) e memoizado por processo: os workers
+# sobem sem coletar dados nem gerar figuras; o pickle em disco evita refazer o trabalho
+@functools.lru_cache(maxsize=1)
+def build_layout():
+    dashboard = load_dashboard()
+    if dashboard is None:
+        return None
+    df, fig_bar, fig_line, fig_pie, fig_map, fig_scatter, r, p_value = dashboard
+
+    return html.Div(style={'fontFamily': 'Arial', 'padding': '20px', 'maxWidth': '1200px', 'margin': 'auto'}, children=[
         html.H1("Impactos da Inflação sobre o Desemprego nas Grandes Regiões (2020-2024)", style={'textAlign': 'center'}),
         html.Hr(),
         
@@ -135,6 +295,31 @@ else:
         html.P(f"Este gráfico responde ao objetivo principal do projeto ao calcular a correlação estatística. O coeficiente de Pearson global calculado é r = {r:.3f} (p-valor: {p_value:.3f}), demonstrando a relação entre pressão inflacionária e mercado de trabalho.", style={'fontStyle': 'italic'})
     ])
 
+# Após uma falha, não tenta a API de novo antes deste intervalo: durante uma queda do
+# IBGE cada page view bloquearia o worker por até 2x15s (timeout do gunicorn é 30s)
+RETRY_COOLDOWN = 5 * 60
+last_failure = 0.0
+
+def serve_layout():
+    global last_failure
+    if time.time() - last_failure < RETRY_COOLDOWN:
+        return html.Div("Erro ao carregar ou cruzar dados da API do IBGE.")
+    try:
+        layout = build_layout()
+    except Exception:
+        layout = None
+    if layout is None:
+        build_layout.cache_clear()  # Não memoiza a falha: tenta de novo após o cooldown
+        last_failure = time.time()
+        return html.Div("Erro ao carregar ou cruzar dados da API do IBGE.")
+    return layout
+
+# Sem callbacks: suppress_callback_exceptions impede que o setter de app.layout
+# chame serve_layout() já no import para montar o validation_layout
+app = dash.Dash(__name__, suppress_callback_exceptions=True)
+app.title = "Dashboard Econométrico: TCC"
+app.layout = serve_layout
+
 # Variavel exigida pelo Render
 server = app.server
 